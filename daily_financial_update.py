@@ -6,9 +6,13 @@ Automatically fetches financial news and creates daily updates in Notion
 
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
+import orjson
+import time
 
 # Configuration from environment variables
 NOTION_API_KEY = os.environ.get('NOTION_API_KEY')
@@ -23,47 +27,156 @@ NOTION_HEADERS = {
     'Notion-Version': NOTION_VERSION
 }
 
+# Serper API Configuration
+SERPER_URL = 'https://google.serper.dev/search'
+SERPER_HEADERS = {
+    'X-API-KEY': SERPER_API_KEY,
+    'Content-Type': 'application/json'
+}
+
+# Serper responses are cached on disk so reruns within the TTL skip the network
+# and don't burn free-tier quota
+SERPER_CACHE_PATH = os.environ.get('SERPER_CACHE_PATH', '.cache/serper_cache.json')
+SERPER_CACHE_TTL = 6 * 60 * 60  # seconds
+
+NOTION_PAGES_URL = 'https://api.notion.com/v1/pages'
+NOTION_ERROR_PREVIEW_CHARS = 512
+NOTION_TEXT_LIMIT = 2000  # max characters per rich text object
+
+# Upper bound on concurrent outbound requests; matches the session's pool size
+# so the fan-out never waits on a connection or spikes Serper's rate limit
+MAX_CONCURRENCY = 8
+
+# Shared HTTP session so the Serper queries and the Notion call reuse
+# keep-alive connections instead of paying a TCP+TLS handshake each time
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONCURRENCY,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+# Serper searches are idempotent, so also retry them on read errors and
+# retryable statuses. Notion page creation keeps the default (no POST retry)
+# so a slow 5xx can't produce a duplicate page.
+SESSION.mount('https://google.serper.dev', HTTPAdapter(
+    pool_maxsize=MAX_CONCURRENCY,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET', 'POST'])
+    )
+))
+
+
+def _load_serper_cache() -> Dict[str, Any]:
+    """Load cached Serper results, dropping entries older than the TTL"""
+    try:
+        with open(SERPER_CACHE_PATH, 'rb') as f:
+            cache = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+    # Anything that doesn't look like a cache we wrote is treated as a miss
+    if not isinstance(cache, dict):
+        return {}
+
+    cutoff = time.time() - SERPER_CACHE_TTL
+    return {
+        query: entry for query, entry in cache.items()
+        if isinstance(entry, dict)
+        and isinstance(entry.get('results'), list)
+        and all(isinstance(result, dict) for result in entry['results'])
+        and isinstance(entry.get('timestamp'), (int, float))
+        and entry['timestamp'] > cutoff
+    }
+
+
+def _save_serper_cache(cache: Dict[str, Any]) -> None:
+    """Persist Serper results; a failed write only costs a cache miss next run"""
+    try:
+        os.makedirs(os.path.dirname(SERPER_CACHE_PATH) or '.', exist_ok=True)
+        with open(SERPER_CACHE_PATH, 'wb') as f:
+            f.write(orjson.dumps(cache))
+    except OSError as e:
+        print(f"Error writing Serper cache: {e}")
+
+
+def _run_query(query: str) -> Optional[List[Dict[str, str]]]:
+    """
+    Run a single Serper search and return its top organic results
+    Returns None on a non-200 or malformed response so the result isn't cached
+    """
+    payload = orjson.dumps({
+        "q": query,
+        "num": 5
+    })
+
+    response = SESSION.post(SERPER_URL, headers=SERPER_HEADERS, data=payload, timeout=10)
+    if response.status_code == 200:
+        data = orjson.loads(response.content)
+        organic = data.get('organic') if isinstance(data, dict) else None
+        if isinstance(organic, list) and all(isinstance(item, dict) for item in organic):
+            return organic[:3]
+
+        print("Error searching with Serper: unexpected response format")
+        return None
+
+    print(f"Error searching with Serper: {response.status_code}")
+    return None
+
 
-def search_financial_news() -> List[Dict[str, str]]:
+def search_financial_news(today_iso: str) -> List[Dict[str, str]]:
     """
     Search for latest financial news using Serper API (free tier: 2,500 queries/month)
     Alternative: Could use NewsAPI, but Serper is more generous for free tier
     """
-    today = datetime.now().strftime('%Y-%m-%d')
-
     # Multiple targeted searches for comprehensive coverage
     search_queries = [
-        f"major financial news worldwide {today} stock market",
-        f"market movers stocks {today}",
-        f"investment opportunities {today} emerging markets"
+        f"major financial news worldwide {today_iso} stock market",
+        f"market movers stocks {today_iso}",
+        f"investment opportunities {today_iso} emerging markets"
     ]
 
     all_results = []
 
-    for query in search_queries:
-        if SERPER_API_KEY:
-            # Use Serper API if available
-            url = "https://google.serper.dev/search"
-            payload = json.dumps({
-                "q": query,
-                "num": 5
-            })
-            headers = {
-                'X-API-KEY': SERPER_API_KEY,
-                'Content-Type': 'application/json'
-            }
+    if not SERPER_API_KEY:
+        # Fallback: Use free public APIs or RSS feeds
+        for query in search_queries:
+            print(f"No Serper API key found. Skipping search: {query}")
+        return all_results
+
+    cache = _load_serper_cache()
+    results_by_query = {
+        query: cache[query]['results'] for query in search_queries if query in cache
+    }
+    pending = [query for query in search_queries if query not in results_by_query]
+
+    if pending:
+        # The queries are independent, so run them concurrently over the shared session
+        with ThreadPoolExecutor(max_workers=min(len(pending), MAX_CONCURRENCY)) as executor:
+            futures = {query: executor.submit(_run_query, query) for query in pending}
 
+        now = time.time()
+        for query, future in futures.items():
+            # A failed query only loses its own results, never the others'
             try:
-                response = requests.post(url, headers=headers, data=payload, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'organic' in data:
-                        all_results.extend(data['organic'][:3])
-            except Exception as e:
+                results = future.result()
+            except (requests.RequestException, orjson.JSONDecodeError) as e:
                 print(f"Error searching with Serper: {e}")
-        else:
-            # Fallback: Use free public APIs or RSS feeds
-            print(f"No Serper API key found. Skipping search: {query}")
+                continue
+
+            if results is not None:
+                results_by_query[query] = results
+                cache[query] = {'timestamp': now, 'results': results}
+
+        _save_serper_cache(cache)
+    else:
+        print("Using cached Serper results")
+
+    # Collect in query order so the report stays deterministic
+    for query in search_queries:
+        all_results.extend(results_by_query.get(query, []))
 
     return all_results
 
@@ -119,46 +232,9 @@ def extract_stock_symbols(news_results: List[Dict]) -> List[str]:
     return sorted(list(found_symbols))
 
 
-def generate_investment_insights(news_results: List[Dict]) -> str:
-    """
-    Generate investment insights based on news and market data
-    This is a template - in production you might use AI APIs or more sophisticated analysis
-    """
-
-    today = datetime.now().strftime('%B %d, %Y')
-
-    # Extract stock symbols from news
-    watchlist_symbols = extract_stock_symbols(news_results)
-
-    # Build content from news results
-    news_summary = "\n\n".join([
-        f"**{item.get('title', 'News Item')}**: {item.get('snippet', 'No description available')}"
-        for item in news_results[:5]
-    ])
-
-    # Build watchlist section
-    if watchlist_symbols:
-        watchlist_section = "## 📊 Stock Symbols to Watch Today/Tomorrow\n\n"
-        watchlist_section += "Based on today's news coverage, these stocks are generating significant attention:\n\n"
-
-        # Format symbols in groups of 5 for readability
-        for i in range(0, len(watchlist_symbols), 5):
-            group = watchlist_symbols[i:i+5]
-            watchlist_section += "**" + " | ".join(f"`${symbol}`" for symbol in group) + "**\n\n"
-
-        watchlist_section += "_Note: Symbols extracted from news mentions. Always conduct your own research before trading._\n\n---\n\n"
-    else:
-        watchlist_section = ""
-
-    content = f"""# Market Overview - {today}
-
-## Key Financial Events Worldwide
-
-{news_summary if news_summary else "Unable to fetch current news. Please check API configurations."}
-
----
-
-{watchlist_section}## Investment Opportunities for Aggressive Growth (Week Ahead)
+# Static sections of the daily report; only the header, news summary, watchlist
+# and footer change between runs, so this is built once at import time
+_TEMPLATE_STATIC_BODY = """## Investment Opportunities for Aggressive Growth (Week Ahead)
 
 ### 🎯 HIGH-CONVICTION PLAYS
 
@@ -221,63 +297,118 @@ For aggressive growth with extra monthly cash flow:
 
 **Disclaimer**: This is educational analysis based on current market data, not personalized financial advice. Markets are inherently risky, especially with aggressive growth strategies. Conduct your own research and consider consulting a licensed financial advisor before making investment decisions.
 
-**Data Sources**: {len(news_results)} news sources analyzed
-**Generated**: {datetime.now().strftime('%Y-%m-%d %H:%M UTC')}
 """
 
-    return content
+NEWS_FALLBACK = "Unable to fetch current news. Please check API configurations."
 
 
-def create_notion_page(content: str) -> bool:
+def generate_investment_insights(news_results: List[Dict], today_long: str, generated_at: str) -> str:
     """
-    Create a new page in the Notion database with today's financial update
+    Generate investment insights based on news and market data
+    This is a template - in production you might use AI APIs or more sophisticated analysis
     """
-    today = datetime.now()
-    page_title = f"Financial Intelligence - {today.strftime('%B %d, %Y')}"
-
-    # Split content into chunks of max 2000 characters to comply with Notion's limits
-    # We'll split on paragraph boundaries for better readability
-    def chunk_content(text: str, max_length: int = 2000) -> List[str]:
-        """Split text into chunks respecting paragraph boundaries"""
-        chunks = []
-        current_chunk = ""
-
-        # Split by double newlines (paragraph breaks)
-        paragraphs = text.split('\n\n')
-
-        for para in paragraphs:
-            # If adding this paragraph would exceed limit, save current chunk
-            if len(current_chunk) + len(para) + 2 > max_length and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = para
-            else:
-                current_chunk += ("\n\n" if current_chunk else "") + para
-
-        # Add final chunk
-        if current_chunk:
+
+    # Extract stock symbols from news
+    watchlist_symbols = extract_stock_symbols(news_results)
+
+    # Build content from news results
+    news_summary = "\n\n".join(
+        f"**{item.get('title') or 'News Item'}**: {item.get('snippet') or 'No description available'}"
+        for item in news_results[:5]
+    )
+
+    # Build watchlist section
+    if watchlist_symbols:
+        watchlist_section = "## 📊 Stock Symbols to Watch Today/Tomorrow\n\n"
+        watchlist_section += "Based on today's news coverage, these stocks are generating significant attention:\n\n"
+
+        # Format symbols in groups of 5 for readability
+        for i in range(0, len(watchlist_symbols), 5):
+            group = watchlist_symbols[i:i+5]
+            watchlist_section += "**" + " | ".join(f"`${symbol}`" for symbol in group) + "**\n\n"
+
+        watchlist_section += "_Note: Symbols extracted from news mentions. Always conduct your own research before trading._\n\n---\n\n"
+    else:
+        watchlist_section = ""
+
+    content = f"""# Market Overview - {today_long}
+
+## Key Financial Events Worldwide
+
+{news_summary or NEWS_FALLBACK}
+
+---
+
+{watchlist_section}{_TEMPLATE_STATIC_BODY}**Data Sources**: {len(news_results)} news sources analyzed
+**Generated**: {generated_at}
+"""
+
+    return content
+
+
+def _chunk_content(text: str, max_length: int = NOTION_TEXT_LIMIT) -> List[str]:
+    """Split text into chunks respecting paragraph boundaries"""
+    if len(text) <= max_length:
+        return [text]
+
+    chunks = []
+    current_chunk = ""
+
+    # Split by double newlines (paragraph breaks)
+    paragraphs = text.split('\n\n')
+
+    for para in paragraphs:
+        # If adding this paragraph would exceed limit, save current chunk
+        if len(current_chunk) + len(para) + 2 > max_length and current_chunk:
             chunks.append(current_chunk.strip())
+            current_chunk = para
+        else:
+            current_chunk += ("\n\n" if current_chunk else "") + para
 
-        return chunks
+    # Add final chunk
+    if current_chunk:
+        chunks.append(current_chunk.strip())
 
-    # Create children blocks from content chunks
-    content_chunks = chunk_content(content)
+    return chunks
+
+
+def create_notion_page(content: str, today_long: str, today_iso: str) -> bool:
+    """
+    Create a new page in the Notion database with today's financial update
+    """
+    page_title = f"Financial Intelligence - {today_long}"
+
+    # Create children blocks: one per report section, with Notion dividers in
+    # place of the markdown rules. Sections are split on paragraph boundaries
+    # only when they exceed Notion's 2000-character rich text limit.
     children_blocks = []
 
-    for chunk in content_chunks:
-        children_blocks.append({
-            "object": "block",
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": [
-                    {
-                        "type": "text",
-                        "text": {
-                            "content": chunk[:2000]  # Extra safety check
+    for section in content.split('\n---\n'):
+        if not section.strip():
+            continue
+
+        if children_blocks:
+            children_blocks.append({
+                "object": "block",
+                "type": "divider",
+                "divider": {}
+            })
+
+        for chunk in _chunk_content(section.strip()):
+            children_blocks.append({
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {
+                    "rich_text": [
+                        {
+                            "type": "text",
+                            "text": {
+                                "content": chunk[:NOTION_TEXT_LIMIT]  # Extra safety check
+                            }
                         }
-                    }
-                ]
-            }
-        })
+                    ]
+                }
+            })
 
     # Build the page data
     page_data = {
@@ -294,7 +425,7 @@ def create_notion_page(content: str) -> bool:
             },
             "Date": {
                 "date": {
-                    "start": today.strftime('%Y-%m-%d')
+                    "start": today_iso
                 }
             },
             "Market Sentiment": {
@@ -310,20 +441,22 @@ def create_notion_page(content: str) -> bool:
     }
 
     try:
-        response = requests.post(
-            'https://api.notion.com/v1/pages',
+        response = SESSION.post(
+            NOTION_PAGES_URL,
             headers=NOTION_HEADERS,
-            json=page_data,
+            data=orjson.dumps(page_data),
             timeout=30
         )
 
         if response.status_code == 200:
+            page = orjson.loads(response.content)
             print(f"✅ Successfully created Notion page: {page_title}")
-            print(f"URL: {response.json().get('url')}")
+            print(f"URL: {page.get('url')}")
             return True
         else:
+            # Notion validation errors can be verbose; the head is enough to diagnose
             print(f"❌ Error creating Notion page: {response.status_code}")
-            print(f"Response: {response.text}")
+            print(f"Response: {response.text[:NOTION_ERROR_PREVIEW_CHARS]}")
             return False
 
     except Exception as e:
@@ -335,8 +468,15 @@ def main():
     """
     Main execution function
     """
+    # Read the clock once so every stage agrees on the date, even across midnight.
+    # Numeric fields are formatted directly; only the month name needs strftime.
+    now = datetime.now()
+    today_iso = f"{now.year:04d}-{now.month:02d}-{now.day:02d}"
+    today_long = now.strftime('%B %d, %Y')
+    generated_at = f"{today_iso} {now.hour:02d}:{now.minute:02d} UTC"
+
     print("🚀 Starting Daily Financial Intelligence Update...")
-    print(f"⏰ Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}")
+    print(f"⏰ Current time: {today_iso} {now.hour:02d}:{now.minute:02d}:{now.second:02d} UTC")
 
     # Validate environment variables
     if not NOTION_API_KEY:
@@ -351,7 +491,7 @@ def main():
 
     # Step 1: Fetch financial news
     print("\n📰 Fetching financial news...")
-    news_results = search_financial_news()
+    news_results = search_financial_news(today_iso)
     print(f"✅ Found {len(news_results)} news items")
 
     # Step 2: Analyze market data
@@ -361,12 +501,12 @@ def main():
 
     # Step 3: Generate insights
     print("\n🧠 Generating investment insights...")
-    content = generate_investment_insights(news_results)
+    content = generate_investment_insights(news_results, today_long, generated_at)
     print("✅ Insights generated")
 
     # Step 4: Create Notion page
     print("\n📝 Creating Notion page...")
-    success = create_notion_page(content)
+    success = create_notion_page(content, today_long, today_iso)
 
     if success:
         print("\n✅ Daily financial update completed successfully!")